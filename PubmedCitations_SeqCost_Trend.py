@@ -15,8 +15,17 @@ log10-transformed values to visualize exponential trends effectively.
 """
 
 # Step 1: Import required libraries
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import pandas as pd
@@ -25,77 +34,134 @@ import numpy as np
 
 # Step 2: Define the range of years for the analysis
 years = range(2000, 2024)  # Includes 2024 for future projections
-
-# Step 3: Initialize dictionaries to store citation data by category
-citations_per_year_multiomics = {}
-citations_per_year_personalized_medicine = {}
-citations_per_year_gxe = {}
-
-# Step 4: Set the base URL for PubMed searches
-base_url = "https://pubmed.ncbi.nlm.nih.gov"
+years_arr = np.fromiter(years, dtype=np.int32)
+
+# Step 3: Citation counts are collected in Step 7 into a 3 x n_years array with one row per
+# category (multi-omics, personalized medicine, GxE) and one column per year
+
+# Step 4: Set the base URL for PubMed searches (NCBI E-utilities ESearch endpoint)
+base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+
+# PubMed web search, used as a fallback when ESearch is unreachable; the result count is read
+# from the "results-amount" element of the results page
+pubmed_url = "https://pubmed.ncbi.nlm.nih.gov/"
+results_amount_re = re.compile(rb'results-amount[^<]*<span[^>]*>\s*([\d,]+)')
+
+# Optional NCBI API key; raises the E-utilities quota from 3 to 10 requests per second
+api_key = os.environ.get('NCBI_API_KEY')
+
+# HTTP adapter that spaces outgoing requests at least `min_interval` seconds apart across all threads
+class ThrottledHTTPAdapter(HTTPAdapter):
+    def __init__(self, min_interval, **kwargs):
+        super().__init__(**kwargs)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_send = 0.0
+
+    def send(self, request, **kwargs):
+        # Reserve the next free send slot under the lock, then sleep until it outside the lock
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send)
+            self._next_send = send_at + self.min_interval
+        time.sleep(send_at - now)
+        return super().send(request, **kwargs)
+
+# Share one session so TCP/TLS connections are reused across requests; responses are
+# cached on disk for a day so reruns (e.g. figure styling tweaks) skip the network.
+# Only cache misses reach the adapter, so cached responses are not throttled. Rate-limit (429) and
+# transient server errors are retried with exponential backoff before the response is returned.
+session = requests_cache.CachedSession('pubmed_cache', expire_after=86400, ignored_parameters=['api_key'])
+retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+session.mount('https://', ThrottledHTTPAdapter(1 / 10 if api_key else 1 / 3, max_retries=retries,
+                                               pool_connections=16, pool_maxsize=16))
 
 # Step 5: Function to fetch citation counts from PubMed
-def get_citations(year, query_terms):
+def get_citations(session, year, query_terms):
     """
     Fetches the number of citations from PubMed for a specific year and query terms.
 
     Args:
+    - session (requests_cache.CachedSession): Session used to issue the HTTP request.
     - year (int): The year for which citation data is retrieved.
     - query_terms (list of str): List of keywords to search in PubMed.
 
     Returns:
-    - int: Citation count for the given year and query terms.
+    - int: Citation count for the given year and query terms. If ESearch is unreachable or keeps
+      returning server errors, the count is read from the PubMed results page instead (0, with a
+      warning, if it cannot be found there).
     """
     query = f"({' OR '.join(query_terms)})[Title/Abstract] AND {year}[Date - Publication]"
-    url = f"{base_url}/?term={query}"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    results_div = soup.find('div', {'class': 'results-amount'})
-    if results_div and results_div.span:
-        results_info = results_div.span.get_text()
-        return int(results_info.split()[0].replace(',', ''))
-    else:
-        return 0
+    params = {'db': 'pubmed', 'term': query, 'rettype': 'count', 'retmode': 'json'}
+    if api_key:
+        params['api_key'] = api_key
+    try:
+        response = session.get(base_url, params=params, timeout=10)
+        esearch_unavailable = response.status_code >= 500
+    except (requests.ConnectionError, requests.Timeout):
+        esearch_unavailable = True
+    if not esearch_unavailable:
+        response.raise_for_status()
+        return int(response.json()['esearchresult']['count'])
+
+    # ESearch is down; fall back to the PubMed results page, which is not cached so a page
+    # without a result count is not reused on later runs
+    response = session.get(pubmed_url, params={'term': query}, timeout=10,
+                           expire_after=requests_cache.DO_NOT_CACHE)
+    response.raise_for_status()
+    match = results_amount_re.search(response.content)
+    count = int(match.group(1).replace(b',', b'')) if match else 0
+    if count == 0:
+        logging.warning("PubMed fallback found no citations for query %r", query)
+    return count
 
 # Step 6: Define search terms for the three categories
 multiomics_terms = ["multiomics", "multi-omics", "Multiomics", "Multi-omics"]
 personalized_medicine_terms = ["personalized-medicine", "precision-medicine", "personalized medicine", "precision medicine"]
 gxe_terms = ["gene-environment interaction", "gene-environment correlation", "GxE interaction", "GxE"]
 
-# Step 7: Loop through each year and retrieve citation counts for each category
-for year in years:
-    citations_per_year_multiomics[year] = get_citations(year, multiomics_terms)
-    citations_per_year_personalized_medicine[year] = get_citations(year, personalized_medicine_terms)
-    citations_per_year_gxe[year] = get_citations(year, gxe_terms)
-
-# Step 8: Load and preprocess sequencing cost data
-cost_data = pd.read_excel('/disk/XX/misc/adelaide/Sequencing_Cost_Data_Table_May2022.xls', usecols=["Date", "Cost per Mb"])
-cost_data['Year'] = pd.to_datetime(cost_data['Date'], errors='coerce').dt.year
-cost_data_grouped = cost_data.groupby('Year')['Cost per Mb'].mean().reset_index()
-
-# Step 9: Prepare log-transformed citation data for plotting
-log_citations_multiomics = {k: np.log10(v) if v > 0 else 0 for k, v in citations_per_year_multiomics.items()}
-log_citations_personalized_medicine = {k: np.log10(v) if v > 0 else 0 for k, v in citations_per_year_personalized_medicine.items()}
-log_citations_gxe = {k: np.log10(v) if v > 0 else 0 for k, v in citations_per_year_gxe.items()}
-
-# Step 10: Log-transform sequencing cost data
-cost_data_grouped['Log_Cost_per_Mb'] = np.log10(cost_data_grouped['Cost per Mb'])
-
-# Step 11: Plotting the data
+# Step 7: Retrieve citation counts for each year and category concurrently; the session's
+# adapter keeps the request rate within NCBI's limit (10 req/s with an API key, 3 without)
+search_terms = [multiomics_terms, personalized_medicine_terms, gxe_terms]
+tasks = [(year, terms) for terms in search_terms for year in years]
+with ThreadPoolExecutor(max_workers=10 if api_key else 3) as executor:
+    counts = executor.map(lambda task: get_citations(session, *task), tasks)
+    citation_counts = np.fromiter(counts, dtype=np.int64, count=len(tasks)).reshape(len(search_terms), len(years))
+
+# Step 8: Load, aggregate and log-transform sequencing cost data
+# The aggregated table is cached as Parquet next to the workbook and reused until the workbook changes
+cost_xls_path = Path('/disk/XX/misc/adelaide/Sequencing_Cost_Data_Table_May2022.xls')
+cost_parquet_path = cost_xls_path.with_suffix('.parquet')
+if cost_parquet_path.exists() and cost_parquet_path.stat().st_mtime > cost_xls_path.stat().st_mtime:
+    cost_data_grouped = pd.read_parquet(cost_parquet_path)
+else:
+    cost_data = pd.read_excel(cost_xls_path, sheet_name=0,
+                              usecols=["Date", "Cost per Mb"], dtype={"Cost per Mb": "float64"},
+                              parse_dates=["Date"], engine='calamine').dropna(subset=["Date"])
+    cost_data['Year'] = (cost_data['Date'].to_numpy().astype('datetime64[Y]').astype(int) + 1970).astype(np.int16)
+    # The workbook rows are chronological, so groups come out in year order without sorting
+    cost_data_grouped = cost_data.groupby('Year', sort=False, as_index=False).agg(cost_mean=('Cost per Mb', 'mean'))
+    cost_data_grouped['Log_Cost_per_Mb'] = np.log10(cost_data_grouped['cost_mean'])
+    cost_data_grouped.to_parquet(cost_parquet_path, index=False)
+
+# Step 9: Prepare log-transformed citation data for plotting (years with no citations map to 0)
+log_mo, log_pm, log_gxe = np.log10(citation_counts, out=np.zeros(citation_counts.shape), where=citation_counts > 0)
+
+# Step 10: Plotting the data
 fig, ax1 = plt.subplots(figsize=(14, 10))
 
 # Plot citation data
-ax1.plot(log_citations_multiomics.keys(), log_citations_multiomics.values(), color='blue', label='Multi-Omics (Log Transformed)', marker='o')
-ax1.plot(log_citations_personalized_medicine.keys(), log_citations_personalized_medicine.values(), color='red', label='Personalized Medicine (Log Transformed)', marker='o')
-ax1.plot(log_citations_gxe.keys(), log_citations_gxe.values(), color='black', label='GxE Interaction (Log Transformed)', marker='x')
+ax1.plot(years_arr, log_mo, color='blue', label='Multi-Omics (Log Transformed)', marker='o')
+ax1.plot(years_arr, log_pm, color='red', label='Personalized Medicine (Log Transformed)', marker='o')
+ax1.plot(years_arr, log_gxe, color='black', label='GxE Interaction (Log Transformed)', marker='x')
 
 # Configure y-axis for citation data
 ax1.set_ylabel('Log10(Number of Citations)', color='black')
 ax1.tick_params(axis='y', labelcolor='black')
 
 # Format y-axis for citation data
-citation_min = np.floor(min(log_citations_multiomics.values()) * 2) / 2
-citation_max = np.ceil(max(log_citations_multiomics.values()) * 2) / 2
+citation_min = np.floor(log_mo.min() * 2) / 2
+citation_max = np.ceil(log_mo.max() * 2) / 2
 ax1.set_yticks(np.arange(citation_min, citation_max + 0.5, 0.5))
 ax1.yaxis.set_major_formatter(FuncFormatter(lambda x, _: f'{x:.1f}'))
 
@@ -26,20 +26,28 @@ Steps:
 """
 
 # Step 1: Import necessary libraries
+from pathlib import Path
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
+import matplotlib.path as mpath
+from matplotlib.collections import PathCollection
 from matplotlib.patches import Patch
 
 # Step 2: Load the GWAS data
-data = pd.read_csv('/disk/XX/GWASmonitor_Data.csv')
+# Country names in the GWAS data that differ from the Natural Earth names used by the GeoDataFrame
+COUNTRY_FIXUPS = {
+    'Korea, South': 'South Korea',
+    'United States': 'United States of America',
+}
 
-# Correct country names for consistency
-data['index'] = data['index'].replace('Korea, South', 'South Korea')
+# Canonicalize country names once on load so the aggregation sees the final keys
+data = pd.read_csv('/disk/XX/GWASmonitor_Data.csv', usecols=['index', 'N'], dtype={'index': 'string', 'N': 'Int64'})
+data['index'] = data['index'].replace(COUNTRY_FIXUPS)
 
 # Aggregate sample sizes across years for each country
-aggregated_data = data.groupby('index').agg({'N': 'sum'}).reset_index()
+aggregated_data = data.groupby('index', sort=False)['N'].sum().reset_index()
 
 # Step 3: Categorize sample sizes into meaningful groups
 categories = {
@@ -53,48 +61,50 @@ categories = {
     'No Data': '#ffffff'        # White for no data
 }
 
-# Function to assign categories based on sample size
-def categorize_sample_size(n):
-    if n > 1000000:
-        return '>1 million'
-    elif n > 100000:
-        return '100k-1M'
-    elif n > 5000:
-        return '5k-100k'
-    elif n > 500:
-        return '501-5k'
-    elif n > 100:
-        return '101-500'
-    elif n > 0:
-        return '1-100'
-    else:
-        return '0'
-
-# Apply categorization to the data
-aggregated_data['sample_size_category'] = aggregated_data['N'].apply(categorize_sample_size)
-aggregated_data['sample_size_category'] = pd.Categorical(aggregated_data['sample_size_category'], 
-                                                         categories=categories.keys(), 
-                                                         ordered=True)
-# Adjust United States name to match GeoDataFrame
-aggregated_data.loc[aggregated_data['index'] == 'United States', 'index'] = 'United States of America'
+# Upper bounds (inclusive) of each sample size group, from '0' up to '100k-1M'; larger totals are '>1 million'
+sample_size_bins = np.array([0, 100, 500, 5000, 100_000, 1_000_000])
+
+# Assign categories with a single binary search over the whole column. `categories` lists the groups
+# from largest to smallest, so the category code counts down from the number of bins.
+bin_idx = np.searchsorted(sample_size_bins, aggregated_data['N'].to_numpy(dtype=np.int64), side='left')
+aggregated_data['sample_size_category'] = pd.Categorical.from_codes(len(sample_size_bins) - bin_idx,
+                                                                    categories=list(categories.keys()),
+                                                                    ordered=True)
 
 # Step 4: Merge the GWAS data with world shape files
-world = gpd.read_file(gpd.datasets.get_path('naturalearth_lowres'))
-world = world[world['continent'] != 'Antarctica']  # Exclude Antarctica
-world = world.merge(aggregated_data, how='left', left_on='name', right_on='index')
+# The filtered shapes are cached as Feather and reused until the Natural Earth dataset changes
+world_path = Path(gpd.datasets.get_path('naturalearth_lowres'))
+world_cache_path = Path('/disk/XX/naturalearth_lowres.feather')
+if world_cache_path.exists() and world_cache_path.stat().st_mtime > world_path.stat().st_mtime:
+    world = gpd.read_feather(world_cache_path)
+else:
+    world = gpd.read_file(world_path)
+    world = world.loc[world['continent'] != 'Antarctica', ['name', 'geometry']]  # Exclude Antarctica
+    world.to_feather(world_cache_path)
+world = world.merge(aggregated_data.set_index('index')[['sample_size_category']],
+                    how='left', left_on='name', right_index=True)
 
 # Set "No Data" explicitly for countries not in the dataset
 world['sample_size_category'] = world['sample_size_category'].fillna('No Data')
 
+# Look up each country's fill color from its category
+world['color'] = world['sample_size_category'].map(categories)
+
 # Step 5: Create the map visualization
-fig, ax = plt.subplots(1, 1, figsize=(25, 15))
+fig, ax = plt.subplots(1, 1, figsize=(12, 7))
 
-# Plot country boundaries
-world.boundary.plot(ax=ax, color='black', linewidth=0.5)
+# Plot countries filled with their category color and outlined as a single collection,
+# one compound path (exterior plus holes) per polygon
+world_parts = world.explode(index_parts=False)
+country_paths = [mpath.Path.make_compound_path(*[mpath.Path(np.asarray(ring.coords)[:, :2], closed=True)
+                                                 for ring in [polygon.exterior, *polygon.interiors]])
+                 for polygon in world_parts.geometry]
+ax.add_collection(PathCollection(country_paths, facecolors=world_parts['color'].to_numpy(),
+                                 edgecolors='black', linewidths=0.5))
+ax.autoscale_view()
 
-# Plot countries with categorized sample sizes
-category_colors = ListedColormap([categories[cat] for cat in categories.keys()])
-world.plot(column='sample_size_category', ax=ax, legend=False, cmap=category_colors)
+# Match geopandas' aspect for geographic coordinates
+ax.set_aspect(1 / np.cos(np.deg2rad(world.total_bounds[[1, 3]].mean())))
 
 # Create a custom legend
 legend_labels = {key: Patch(facecolor=color, edgecolor=color) for key, color in categories.items()}
@@ -103,13 +113,13 @@ ax.legend(handles=[legend_labels[key] for key in legend_labels],
           title='GWAS Sample Size',
           loc='lower left',
           bbox_to_anchor=(-0.05, -0.05),  # Adjust legend position
-          fontsize=16,
-          title_fontsize=20)
+          fontsize=8,
+          title_fontsize=10)
 
 # Title and formatting
-plt.title('Global Distribution of Total GWAS Sample Sizes by Country', fontsize=20, pad=20)
+plt.title('Global Distribution of Total GWAS Sample Sizes by Country', fontsize=10, pad=10)
 ax.axis('off')  # Remove axis lines and ticks
 
 # Step 6: Save the figure
-plt.savefig('/disk/CC/GWAS_population_adjusted_map.png', bbox_inches='tight')
+plt.savefig('/disk/CC/GWAS_population_adjusted_map.png', dpi=200, bbox_inches='tight', pil_kwargs={'optimize': True})
 plt.show()